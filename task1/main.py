@@ -15,6 +15,11 @@ TEL_HOST: str  = str(os.getenv("TEL_HOST", "0.0.0.0"))
 TEL_PORT: int = int(os.getenv("TEL_PORT", "5600"))
 PROTO: str    = str(os.getenv("PROTO", "tcp"))
 
+# Углы поворотов маршрута
+TURN_BACK: float   = math.pi
+TURN_FIRST: float  = normalize_angle(math.pi + math.pi / 1.8)
+TURN_SECOND: float = normalize_angle(math.pi + math.pi / 1.85)
+
 
 if __name__ == "__main__":
      # Инициализация робота
@@ -24,16 +29,16 @@ if __name__ == "__main__":
 
     # Первый этап
     bot.telemetry.visualize_lidar_front()
-    bot.turn_by_angle2(math.pi)
+    bot.turn_by_angle2(TURN_BACK)
     bot.telemetry.visualize_lidar_front()
     bot.forward_to_the_wall()
     # time.sleep(0.5)
     bot.telemetry.visualize_lidar_front()
     print("*************************************************************************************************************************************************")
-    bot.turn_by_angle2(normalize_angle(math.pi + math.pi / 1.8))
+    bot.turn_by_angle2(TURN_FIRST)
     bot.forward_to_the_wall()
     bot.telemetry.visualize_lidar_front()
-    bot.turn_by_angle2(normalize_angle(math.pi + math.pi / 1.85))
+    bot.turn_by_angle2(TURN_SECOND)
     bot.telemetry.visualize_lidar_front()
     bot.forward_to_the_wall()
     bot.telemetry.visualize_lidar_front()
\ No newline at end of file
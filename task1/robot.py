@@ -1,8 +1,12 @@
 import math
 import logging
+import numpy as np
+from numba import njit
 import structlog
+import selectors
 import socket
 import struct
+import sys
 import time
 
 # Настройка логгера
@@ -13,30 +17,59 @@ structlog.configure(
     wrapper_class=structlog.make_filtering_bound_logger(logging.DEBUG),
 )
 
+# Цветные ячейки визуализации лидара: <=0.3, <=0.5, <=1.0, дальше
+LIDAR_LUT = ("\033[91m█\033[0m", "\033[93m█\033[0m", "\033[92m█\033[0m", " ")
+LIDAR_BINS = (0.3, 0.5, 1.0)
+
+# Заранее скомпилированные форматы пакетов
+_U32 = struct.Struct("<I")   # размер кадра / число лучей
+_CMD = struct.Struct("<2f")  # команда (v, w)
+
+# Угловая скорость поворота по |ошибке|: <=0.1, <=0.3, больше
+TURN_BINS = np.array([0.1, 0.3])
+TURN_W = np.array([0.12, 0.3, 0.6])
+
 class CommandClient:
     """Отправка команд по UDP"""
     def __init__(self, host: str, port: int):
         self.host = host
         self.port = port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        if sys.platform.startswith("linux"):
+            # В модуле socket этих констант нет: IP_MTU_DISCOVER=10, IP_PMTUDISC_DO=2 из <linux/in.h>
+            self.sock.setsockopt(socket.IPPROTO_IP, 10, 2)
+        # Адрес фиксируем один раз, дальше send() без поиска маршрута
+        self.sock.connect((host, port))
+        # Один буфер на все команды, заполняется на месте
+        self._buf = bytearray(_CMD.size)
+        self._pack = _CMD.pack_into
 
     def send_command(self, v: float, w: float):
-        packet = struct.pack("<2f", v, w)
-        self.sock.sendto(packet, (self.host, self.port))
+        self._pack(self._buf, 0, v, w)
+        try:
+            self.sock.send(self._buf)
+        except ConnectionRefusedError:
+            pass  # ICMP от прошлой отправки: получатель ещё не слушает, как и со sendto
 
 
 class TelemetryClient:
     """Приём телеметрии по TCP или UDP"""
     def __init__(self, host: str, port: int, proto: str = "tcp"):
-        self.logger = structlog.getLogger("telemetry")
+        # bind() сразу собирает логгер, вместо ленивого прокси на каждый вызов
+        self.logger = structlog.getLogger("telemetry").bind()
         self.host = host
         self.port = port
         self.proto = proto.lower()
-        self.pose = (0.0, 0.0, 0.0)
-        self.velocity = (0.0, 0.0, 0.0)
-        self.angular_velocity = (0.0, 0.0, 0.0)
-        self.lidar_ranges = []
+        # odom(3) + velocity(3) + angular_velocity(3), обновляется на месте
+        self._state = np.zeros(9, dtype=np.float32)
+        self.lidar_ranges = np.empty(0, dtype=np.float32)
         self.last_update_time = 0.0
+        self._last_update_mono = -math.inf  # для возраста кадра, не зависит от перевода часов
+        self._consumed = True  # кадр уже использован вызывающим кодом
+        # Переиспользуемые буферы приёма
+        self._hdr_buf = bytearray(4)
+        self._pkt_buf = bytearray(65536)
 
         if self.proto == "tcp":
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -49,76 +82,139 @@ class TelemetryClient:
         else:  # udp
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.sock.bind((host, port))  # или connect, зависит от архитектуры
-
-    def recv_all(self, size: int) -> bytes:
-        buf = b""
-        while len(buf) < size:
-            chunk = self.sock.recv(size - len(buf))
-            if not chunk:
+        # Неблокирующий режим: update() вычитывает все накопившиеся кадры
+        self.sock.setblocking(False)
+
+        # Ожидание готовности телеметрии вместо слепого sleep
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+
+    def recv_all(self, view: memoryview, started: bool = True) -> None:
+        """Заполнить view целиком данными из сокета.
+
+        Если started=False и данных ещё нет, пробрасывает BlockingIOError.
+        """
+        off = 0
+        size = len(view)
+        while off < size:
+            try:
+                n = self.sock.recv_into(view[off:])
+            except BlockingIOError:
+                if off == 0 and not started:
+                    raise
+                self.selector.select()  # кадр уже начат — дочитываем
+                continue
+            if not n:
                 raise ConnectionError("Соединение разорвано")
-            buf += chunk
-        return buf
+            off += n
+
+    def recv_telemetry(self) -> np.ndarray:
+        """Принять один кадр телеметрии.
 
-    def recv_telemetry(self):
+        Обновляет состояние клиента: pose, velocity и angular_velocity
+        записываются на месте в self._state. Возвращает дальности лидара
+        (float32 ndarray); self.lidar_ranges не трогает — это делает update().
+        """
         if self.proto == "udp":
-            data, _ = self.sock.recvfrom(65535)
+            size = self.sock.recv_into(self._pkt_buf)
         else:
-            size_bytes = self.recv_all(4)
-            size = struct.unpack("<I", size_bytes)[0]
-            data = self.recv_all(size)
-
-        if not data.startswith(b"WBTG"):
+            self.recv_all(memoryview(self._hdr_buf), started=False)
+            size = _U32.unpack_from(self._hdr_buf, 0)[0]
+            if size > len(self._pkt_buf):
+                self._pkt_buf = bytearray(size)
+            self.recv_all(memoryview(self._pkt_buf)[:size])
+        data = memoryview(self._pkt_buf)[:size]
+
+        if data[:4] != b"WBTG":
             raise ValueError("Неверная сигнатура пакета")
 
         header_size = 4 + 9 * 4  # 40 байт
-        odom_x, odom_y, odom_th, vx, vy, vth, wx, wy, wz = struct.unpack("<9f", data[4:header_size])
-        n = struct.unpack("<I", data[header_size:header_size + 4])[0]
-        ranges = []
-        if n > 0:
-            ranges = struct.unpack(f"<{n}f", data[header_size + 4:header_size + 4 + 4 * n])
-
-        return {
-            "pose": (odom_x, odom_y, odom_th),
-            "velocity": (vx, vy, vth),
-            "angular_velocity": (wx, wy, wz),
-            "lidar_ranges": list(ranges)
-        }
+        self._state[:] = np.frombuffer(data, dtype="<f4", count=9, offset=4)
+        n = _U32.unpack_from(data, header_size)[0]
+        # Копия: буфер пакета переиспользуется на следующем приёме
+        return np.frombuffer(data, dtype="<f4", count=n, offset=header_size + 4).copy()
+
+    @property
+    def pose(self) -> np.ndarray:
+        """(x, y, th) — view на self._state"""
+        return self._state[0:3]
+
+    @property
+    def velocity(self) -> np.ndarray:
+        """(vx, vy, vth) — view на self._state"""
+        return self._state[3:6]
+
+    @property
+    def angular_velocity(self) -> np.ndarray:
+        """(wx, wy, wz) — view на self._state"""
+        return self._state[6:9]
 
     def log(self):
-        self.update()
+        self.update(max_age=0)
+        if not self.logger.is_enabled_for(logging.INFO):
+            return
         data = {
-            "pose": tuple(round(x, 3) for x in self.pose),
-            "velocity": tuple(round(v, 3) for v in self.velocity),
-            "angular_velocity": tuple(round(v, 3) for v in self.angular_velocity),
-            "lidar_ranges": [round(r, 2) for r in self.lidar_ranges[:10]]
+            "pose": tuple(round(x, 3) for x in self.pose.tolist()),
+            "velocity": tuple(round(v, 3) for v in self.velocity.tolist()),
+            "angular_velocity": tuple(round(v, 3) for v in self.angular_velocity.tolist()),
+            "lidar_ranges": [round(r, 2) for r in self.lidar_ranges[:10].tolist()]
         }
         self.logger.info("bot state", **data)
 
-    def update(self, looking=False):
-        data = self.recv_telemetry()
-        self.pose = data["pose"]
-        self.velocity = data["velocity"]
-        self.angular_velocity = data["angular_velocity"]
-        self.lidar_ranges = data["lidar_ranges"]
+    def update(self, looking=False, max_age: float = 0.05):
+        """Обновить телеметрию; max_age=0 — всегда читать новый кадр"""
+        # Свежий кадр ещё не использован — повторно не читаем
+        if not self._consumed and time.monotonic() - self._last_update_mono < max_age:
+            if looking and self.logger.is_enabled_for(logging.DEBUG):
+                self.logger.debug("update telemetry", time=self.last_update_time, reused=True)
+            return
+        self._drain(looking)
+
+    def consume(self):
+        """Отметить текущий кадр как использованный: следующий update() прочитает новый"""
+        self._consumed = True
+
+    def _drain(self, looking=False):
+        # Ждём хотя бы один кадр, затем вычитываем очередь до самого свежего
+        ranges = None
+        while True:
+            try:
+                ranges = self.recv_telemetry()
+            except BlockingIOError:
+                if ranges is not None:
+                    break
+                self.selector.select()
+        self.lidar_ranges = ranges
         self.last_update_time = time.time()
-        if looking:
+        self._last_update_mono = time.monotonic()
+        self._consumed = False
+        if looking and self.logger.is_enabled_for(logging.DEBUG):
             self.logger.debug("update telemetry", time=self.last_update_time)
 
+    def wait_for_update(self, timeout: float = 0.05) -> bool:
+        """Дождаться пакета телеметрии (не дольше timeout) и обновить состояние"""
+        if not self.selector.select(timeout):
+            return False
+        self._drain()
+        return True
+
     def close(self):
+        self.selector.close()
         self.sock.close()
 
     def has_clear_path(self, threshold=0.55):
-        for r in self.lidar_ranges:
-            if 0.1 < r < 20.0:  # валидный диапазон
-                if r < threshold:
-                    print(self.lidar_ranges)
-                    return False  # препятствие найдено
+        arr = self.lidar_ranges
+        valid = (arr > 0.1) & (arr < 20.0)  # валидный диапазон
+        if np.any(arr[valid] < threshold):
+            print(arr.tolist())
+            return False  # препятствие найдено
         return True  # путь чист
 
-    def visualize_lidar_front(self):
-        self.update()
+    def visualize_lidar_front(self, max_age: float = 0.05):
+        # Свежий неиспользованный кадр переиспользуется, иначе читаем новый
+        self.update(max_age=max_age)
         ranges = self.lidar_ranges
-        if not ranges:
+        if len(ranges) == 0:
             print("Нет данных лидара")
             return
 
@@ -127,18 +223,10 @@ class TelemetryClient:
             print(f"Ожидалось 360 значений, получено {n}. Визуализация может быть неточной.")
             return
 
-        result_vision = ""
-
-        for i in range(0, len(ranges), 4):
-            r = sum(ranges[i:i + 4]) / 4
-            if r <= 0.3:
-                result_vision += f"\033[91m{"█"}\033[0m"
-            elif r <= 0.5:
-                result_vision += f"\033[93m{"█"}\033[0m"
-            elif r <= 1:
-                result_vision += f"\033[92m{"█"}\033[0m"
-            else:
-                result_vision += " "
+        # Среднее по группам из 4 лучей и номер цветовой корзины
+        means = np.asarray(ranges, dtype=np.float32).reshape(90, 4).mean(axis=1, dtype=np.float64)
+        idx = np.digitize(means, LIDAR_BINS, right=True)
+        result_vision = "".join(map(LIDAR_LUT.__getitem__, idx.tolist()))
         self.logger.info("bot vision")
         print(result_vision)
 
@@ -160,50 +248,60 @@ class Robot:
         self.commands.send_command(0.0, 0.0)
         time.sleep(0.2)  # дать начать останавливаться
 
+        # Локальные ссылки для горячих циклов
+        telemetry = self.telemetry
+        wait = telemetry.wait_for_update
+        send = self.commands.send_command
+
         # Ждём, пока скорость станет ПОЧТИ нулём
         while True:
-            self.telemetry.update()
-            self.commands.send_command(0.0, 0.0)
-            vx, vy, vth = self.telemetry.velocity
+            fresh = wait(0.05)
+            send(0.0, 0.0)
+            if not fresh:
+                continue  # нового кадра нет — скорость по старому не проверяем
+            vx, vy, vth = telemetry.velocity
             if abs(vx) < 0.01 and abs(vy) < 0.01 and abs(vth) < 0.01:
                 break
-            time.sleep(0.02)
 
         # Теперь точно остановлены — начинаем поворот
-        self.telemetry.update()
-        start_th = self.telemetry.pose[2]
+        # (проверка скорости кадр не расходует, поэтому он переиспользуется)
+        telemetry.update()
+        start_th = float(telemetry.pose[2])
         target_th = start_th + delta_theta
 
         while True:
-            self.telemetry.update()
-            current_th = self.telemetry.pose[2]
-            error = normalize_angle(target_th - current_th)
-
-            if abs(error) < 0.08:  # ~5 градусов
+            if not wait(0.05):
+                send(0.0, 0.0)  # телеметрия молчит — не крутимся по старому курсу
+                continue
+            w, done = compute_w(target_th, telemetry.pose[2])
+            telemetry.consume()
+            if done:
                 break
 
-            if abs(error) > 0.3:
-                w = 0.6 * (1 if error > 0 else -1)
-            elif abs(error) > 0.1:
-                w = 0.3 * (1 if error > 0 else -1)
-            else:
-                w = 0.12 * (1 if error > 0 else -1)
-
-            self.commands.send_command(0.0, w)
-            time.sleep(0.01)
+            send(0.0, w)
 
         # Финальная остановка
-        self.commands.send_command(0.0, 0.0)
+        send(0.0, 0.0)
 
     def forward_to_the_wall(self):
         self.logger.info("moving forward (acceleration-aware)")
         MAX_SPEED = 0.5  # ← безопасное значение даже при SPEEDUP=1
         TARGET_STOP = 0.4
 
+        # Локальные ссылки для горячих циклов
+        telemetry = self.telemetry
+        wait = telemetry.wait_for_update
+        send = self.commands.send_command
+        sleep = time.sleep
+
         while True:
-            self.telemetry.update()
-            valid_ranges = [r for r in self.telemetry.lidar_ranges if 0.1 < r < 20.0]
-            min_dist = min(valid_ranges) if valid_ranges else float('inf')
+            if not wait(0.05):
+                send(0.0, 0.0)  # телеметрия молчит — не едем по старому лидару
+                continue
+            arr = telemetry.lidar_ranges
+            valid = (arr > 0.1) & (arr < 20.0)
+            min_dist = float(arr[valid].min()) if valid.any() else float('inf')
+            telemetry.consume()
 
             if min_dist <= TARGET_STOP:
                 speed = 0.0
@@ -213,18 +311,29 @@ class Robot:
             else:
                 speed = MAX_SPEED
 
-            self.commands.send_command(speed, 0.0)
+            send(speed, 0.0)
             if min_dist <= TARGET_STOP:
                 break
-            time.sleep(0.01)
 
         # Гарантированная остановка + учёт ускорения
         for _ in range(30):
-            self.commands.send_command(0.0, 0.0)
-            time.sleep(0.01)
+            send(0.0, 0.0)
+            sleep(0.01)
 
-        time.sleep(0.3)  # ← даём физике остановиться
+        sleep(0.3)  # ← даём физике остановиться
 
 def normalize_angle(angle):
     """Привести угол к диапазону [-pi, pi]"""
-    return math.atan2(math.sin(angle), math.cos(angle))
\ No newline at end of file
+    return math.remainder(angle, math.tau)
+
+
+# Явная сигнатура: компиляция при импорте, а не на первом тике поворота
+@njit("Tuple((float64, boolean))(float64, float64)", cache=True)
+def compute_w(target: float, current: float) -> tuple[float, bool]:
+    """Угловая скорость поворота к target и флаг достижения цели"""
+    e = target - current
+    e -= math.tau * round(e / math.tau)  # normalize_angle; math.remainder в numba нет
+    ae = abs(e)
+    if ae < 0.08:  # ~5 градусов
+        return 0.0, True
+    return math.copysign(TURN_W[np.searchsorted(TURN_BINS, ae)], e), False